@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
 
+import functools
 import logging
 import uuid
 from urllib.parse import urlencode
 
+import orjson
 import pytz
 import requests
 import uwsgidecorators
@@ -12,6 +14,10 @@ from timezonefinder import TimezoneFinder
 
 logger = logging.getLogger(__name__)
 
+# A shared HTTP session so that calls to the CalTopo API reuse keep-alive connections rather than
+# performing a new TCP/TLS handshake for every request.
+http_session = requests.Session()
+
 
 class CaltopoMap:
     """
@@ -42,8 +48,8 @@ class CaltopoMap:
             "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
             "Cookie": f"JSESSIONID={self.session_id}",
         }
-        response = requests.get(url, headers=headers, verify=True, timeout=60)
-        return response.json()
+        response = http_session.get(url, headers=headers, verify=True, timeout=60)
+        return orjson.loads(response.content)
 
     def get_map_features(self) -> None:
         """
@@ -82,7 +88,7 @@ class CaltopoMap:
             "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
             "Cookie": f"JSESSIONID={self.session_id}",
         }
-        response = requests.post(
+        response = http_session.post(
             url,
             headers=headers,
             data=urlencode(
@@ -103,10 +109,9 @@ class CaltopoMap:
         if not response.ok:
             logger.info(f"WARNING: unable to create test folder: {response.text}")
             return False
-        url = (
-            f"https://caltopo.com/api/v1/map/{self.map_id}/Folder/{response.json()['result']['id']}"
-        )
-        requests.delete(url, headers=headers, verify=True, timeout=120)
+        folder_id = orjson.loads(response.content)["result"]["id"]
+        url = f"https://caltopo.com/api/v1/map/{self.map_id}/Folder/{folder_id}"
+        http_session.delete(url, headers=headers, verify=True, timeout=120)
         return True
 
 
@@ -163,6 +168,27 @@ class CaltopoMarker(CaltopoFeature):
         self.symbol = self.properties.get("marker-symbol")
         self.gmaps_url = f"http://maps.google.com/maps?z=12&t=m&q=loc:{self.coordinates[1]}+{self.coordinates[0]}"
 
+    @property
+    def coordinates(self) -> list:
+        """
+        The coordinates of the marker in (longitude, latitude) order.
+
+        :return list: The coordinates in (longitude, latitude) order.
+        """
+        return self._lonlat
+
+    @coordinates.setter
+    def coordinates(self, lonlat: list) -> None:
+        """
+        Sets the coordinates of the marker. The (latitude, longitude) order is stored alongside so
+        that readers do not need to reverse the coordinates each time.
+
+        :param list lonlat: The coordinates in (longitude, latitude) order.
+        :return None:
+        """
+        self._lonlat = lonlat
+        self.latlon = lonlat[::-1]
+
     @property
     def as_json(self) -> dict:
         """
@@ -204,7 +230,7 @@ class CaltopoMarker(CaltopoFeature):
             "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
             "Cookie": f"JSESSIONID={self.session_id}",
         }
-        response = requests.post(
+        response = http_session.post(
             url, headers=headers, data=urlencode({"json": self.as_json}), verify=True, timeout=120
         )
         if not response.ok:
@@ -240,6 +266,17 @@ class CaltopoFolder(CaltopoFeature):
         super().__init__(feature_dict, map_id, session_id)
 
 
+@functools.lru_cache(maxsize=1)
+def get_timezone_finder() -> TimezoneFinder:
+    """
+    Returns a shared TimezoneFinder. Creating one loads the timezone data from disk so it should
+    only be done once.
+
+    :return TimezoneFinder: The shared timezone finder.
+    """
+    return TimezoneFinder()
+
+
 def get_timezone(latlon: list):
     """
     Given a location by coordinates, returns the timezone.
@@ -247,8 +284,7 @@ def get_timezone(latlon: list):
     :param list latlon: The latitude, longitude of the location.
     :return pytz: A timezone object.
     """
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lat=latlon[0], lng=latlon[1])
+    timezone_str = get_timezone_finder().timezone_at(lat=latlon[0], lng=latlon[1])
     if timezone_str:
         logger.info(f"determined {latlon} to be in timezone {timezone_str}")
         return pytz.timezone(timezone_str)
@@ -4,10 +4,10 @@
 import datetime
 
 import numpy as np
-from geopy.distance import geodesic
 from scipy.spatial import KDTree
 
 from .caltopo import CaltopoMarker, CaltopoShape, get_timezone
+from .utils import equirectangular_distance, geodesic_segment_distances
 
 
 def interpolate_and_filter_points(
@@ -26,19 +26,15 @@ def interpolate_and_filter_points(
 
     :return numpy.ndarray: An array of filtered and interpolated points with latitude and longitude coordinates.
     """
-    interpolated_points = np.empty((0, 2), dtype=float)
-    interpolated_points = np.vstack([interpolated_points, [coordinates[0, 0], coordinates[0, 1]]])
-    last_point = interpolated_points[0]
+    # Collect the points in a list and build the array once at the end; stacking onto a growing
+    # array for every point is quadratic in the length of the route.
+    interpolated_points = [coordinates[0]]
+    last_point = coordinates[0]
     for i in range(1, len(coordinates) - 1):
-        point1 = {"latitude": last_point[0], "longitude": last_point[1]}
-        point2 = {"latitude": coordinates[i + 1, 0], "longitude": coordinates[i + 1, 1]}
-
-        # Convert latitude and longitude to (lat, lon) tuples
-        coords1 = (point1["latitude"], point1["longitude"])
-        coords2 = (point2["latitude"], point2["longitude"])
-
-        # Calculate the distance between consecutive points
-        distance_between_points = geodesic(coords1, coords2).feet
+        point2 = coordinates[i + 1]
+        # Calculate the distance between consecutive points. These are close together so the
+        # equirectangular approximation is accurate enough.
+        distance_between_points = equirectangular_distance(last_point, point2)
 
         if distance_between_points < min_interval_dist:
             # Skip adding this point if it's too close to the previous one
@@ -48,26 +44,17 @@ def interpolate_and_filter_points(
             # Calculate the number of intervals needed
             num_intervals = int(distance_between_points / max_interval_dist)
             # Calculate the step size for latitude and longitude
-            lat_step = (point2["latitude"] - point1["latitude"]) / num_intervals
-            lon_step = (point2["longitude"] - point1["longitude"]) / num_intervals
-            # Generate interpolated points
-            intermediate_array = np.array(
-                [
-                    [point1["latitude"] + j * lat_step, point1["longitude"] + j * lon_step]
-                    for j in range(1, num_intervals + 1)  # Include the last point
-                ]
+            step = (point2 - last_point) / num_intervals
+            # Generate interpolated points, including the last point
+            interpolated_points.extend(
+                last_point + np.arange(1, num_intervals + 1)[:, np.newaxis] * step
             )
-            interpolated_points = np.vstack([interpolated_points, intermediate_array])
         else:
-            interpolated_points = np.vstack(
-                [interpolated_points, [point2["latitude"], point2["longitude"]]]
-            )
+            interpolated_points.append(point2)
         last_point = interpolated_points[-1]
     # Include the last point of the original array
-    interpolated_points = np.vstack(
-        [interpolated_points, [point2["latitude"], point2["longitude"]]]
-    )
-    return interpolated_points
+    interpolated_points.append(point2)
+    return np.array(interpolated_points)
 
 
 def transform_path(path_data: list, min_step_size: float, max_step_size: float) -> tuple:
@@ -84,23 +71,19 @@ def transform_path(path_data: list, min_step_size: float, max_step_size: float)
     :return tuple: The newly interpolated path as a numpy array and the array of the cumulative
     distances.
     """
-    cumulative_distance = 0
-    prev_point = None
     interpolated_path_data = interpolate_and_filter_points(
-        np.array(path_data), min_step_size, max_step_size
+        np.array(path_data, dtype=np.float64), min_step_size, max_step_size
     )
-    cumulative_distances_array = np.zeros(len(interpolated_path_data))
-
-    for i, point in enumerate(interpolated_path_data):
-        if prev_point is not None:
-            geo = geodesic(
-                (prev_point[0], prev_point[1], prev_point[2] if len(prev_point) == 3 else 0),
-                (point[0], point[1], point[2] if len(point) == 3 else 0),
-            )
-            distance = geo.miles
-            cumulative_distance += distance
-        cumulative_distances_array[i] = cumulative_distance
-        prev_point = point
+    # Distances (in miles) between each consecutive pair of points.
+    segment_distances = (
+        geodesic_segment_distances(
+            np.radians(interpolated_path_data[:, 0]), np.radians(interpolated_path_data[:, 1])
+        )
+        / 5280
+    )
+    cumulative_distances_array = np.empty(len(interpolated_path_data))
+    cumulative_distances_array[0] = 0.0
+    np.cumsum(segment_distances, out=cumulative_distances_array[1:])
     return interpolated_path_data, cumulative_distances_array
 
 
@@ -231,6 +214,23 @@ class Route(CaltopoShape):
         # TODO this doesn't handle 3 long lists.
         self.points, self.distances = transform_path([[y, x] for x, y in self.coordinates], 5, 100)
         self.length = self.distances[-1]
+        # A (longitude, latitude) view of the points for placing markers on the map.
+        self.lonlat_points = self.points[:, ::-1]
         self.start_location = self.points[0]
         self.finish_location = self.points[-1]
-        self.kdtree = KDTree(self.points)
+        # Degrees of longitude shrink with latitude, so scale them to match degrees of latitude
+        # before building the tree. Over the extent of a course this makes Euclidean distance in
+        # the tree proportional to ground distance.
+        self.projection_scale = np.array([1.0, np.cos(np.radians(self.points[:, 0].mean()))])
+        self.kdtree = KDTree(self.points * self.projection_scale)
+
+    def nearest_indices(self, latlon: list, count: int) -> np.ndarray:
+        """
+        Finds the indices of the points on the route closest to the given coordinates.
+
+        :param list latlon: The coordinates to search around in (latitude, longitude) order.
+        :param int count: The number of indices to return.
+        :return numpy.ndarray: The indices of the closest points, ordered nearest first.
+        """
+        _, indices = self.kdtree.query(np.asarray(latlon) * self.projection_scale, k=count)
+        return indices
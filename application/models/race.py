@@ -1,22 +1,28 @@
 #!/usr/bin/env python3
 
 
+import bisect
 import datetime
-import json
 import logging
 import os
-from math import atan2, cos, radians, sin, sqrt
 
 import numpy as np
+import orjson
 import pytz
-from scipy.stats import norm
 
 from .caltopo import CaltopoMarker
 from .course import Route
 from .tracker import Ping
+from .utils import haversine_distance
 
 logger = logging.getLogger(__name__)
 
+# Course deviation thresholds (in feet) and the background colors used for each deviation band.
+DEVIATION_THRESHOLDS = (100, 150, 200)
+DEVIATION_COLORS = ("#90EE90", "#FAFAD2", "#FFD700", "#FFC0CB")
+# The pace in minutes per mile of a speed of 1 kph (60 minutes per hour * 1.60934 km per mile).
+KPH_TO_MIN_PER_MI = 60 * 1.60934
+
 
 def format_duration(duration: datetime.timedelta) -> str:
     """
@@ -25,11 +31,9 @@ def format_duration(duration: datetime.timedelta) -> str:
     :param datetime.timedelta duration: A time duration.
     :return str: The formatted duration.
     """
-    total_hours = duration.total_seconds() / 3600
-    hours, remainder = divmod(total_hours, 1)
-    minutes, remainder = divmod(remainder * 60, 1)
-    seconds, _ = divmod(remainder * 60, 1)
-    return f"{int(hours)}:{int(minutes):02}'{int(seconds):02}\""
+    hours, remainder = divmod(int(duration.total_seconds()), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}:{minutes:02}'{seconds:02}\""
 
 
 def format_distance(distance_ft: float) -> str:
@@ -43,10 +47,8 @@ def format_distance(distance_ft: float) -> str:
     with one decimal point.
     """
     if distance_ft >= 5280:
-        distance_mi = distance_ft / 5280
-        return f"{distance_mi:.1f} mi"
-    else:
-        return f"{distance_ft:.1f} ft"
+        return f"{distance_ft / 5280:.1f} mi"
+    return f"{distance_ft:.1f} ft"
 
 
 def convert_decimal_pace_to_pretty_format(decimal_pace: float) -> str:
@@ -57,8 +59,7 @@ def convert_decimal_pace_to_pretty_format(decimal_pace: float) -> str:
     :return str: The formatted pace as mm'ss".
     """
     total_seconds = int(decimal_pace * 60)  # Convert pace to total seconds
-    minutes, remainder = divmod(total_seconds, 60)
-    seconds, _ = divmod(remainder, 1)
+    minutes, seconds = divmod(total_seconds, 60)
     return f"{minutes}'{seconds:02d}\""
 
 
@@ -70,8 +71,7 @@ def kph_to_min_per_mi(kph: float) -> float:
     :param float kph: Speed in kilometers per hour.
     :return float: Speed in minutes per mile.
     """
-    miles_per_hour = kph / 1.60934
-    return 60 / miles_per_hour if miles_per_hour != 0 else 0.0
+    return KPH_TO_MIN_PER_MI / kph if kph != 0 else 0.0
 
 
 def calculate_most_probable_mile_mark(
@@ -95,41 +95,15 @@ def calculate_most_probable_mile_mark(
     expected_distance = elapsed_time * average_speed
     # Calculate standard deviation based on average pace
     standard_deviation = average_pace / 3  # Adjust for variability in pace
-    # Calculate probabilities for each mile mark
-    probabilities = norm.pdf(mile_marks, loc=expected_distance, scale=standard_deviation)
+    # Score each mile mark with the unnormalized normal density; the normalizing constant doesn't
+    # change which mile mark scores highest.
+    z_scores = (np.asarray(mile_marks, dtype=float) - expected_distance) / standard_deviation
+    probabilities = np.exp(-0.5 * z_scores * z_scores)
     # Find the mile mark with the highest probability
     most_probable_mile_mark = mile_marks[np.argmax(probabilities)]
     return most_probable_mile_mark
 
 
-def haversine_distance(coord1: list, coord2: list) -> float:
-    """
-    Calculate the Haversine distance between two points specified by their latitude and longitude coordinates.
-
-    :param list coord1: Latitude and longitude coordinates of the first point in the format
-    [latitude, longitude].
-    :param list coord2: Latitude and longitude coordinates of the second point in the format
-    [latitude, longitude].
-    :return float: The distance between the two points in feet.
-    """
-    # Radius of the Earth in kilometers
-    R = 6371.0
-    # Convert latitude and longitude from degrees to radians
-    lat1 = radians(coord1[0])
-    lon1 = radians(coord1[1])
-    lat2 = radians(coord2[0])
-    lon2 = radians(coord2[1])
-    # Compute the differences between latitudes and longitudes
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    # Haversine formula
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    distance_km = R * c
-    # Convert kilometers to feet (1 km = 3280.84 feet)
-    return distance_km * 3280.84
-
-
 class Race:
     """
     This object orchestrates a race.
@@ -158,6 +132,8 @@ class Race:
         self.started = False
         self.last_ping_raw = {}
         self.map_url = caltopo_map.url
+        # Bumped whenever the race state changes so that rendered pages can be cached until then.
+        self.version = 0
         self.restore()
         logger.info(f"race at {self.start_time} of {self.course.route.length} mi")
 
@@ -182,6 +158,8 @@ class Race:
 
         :return dict: Runner and race stats.
         """
+        course_deviation = self.runner.course_deviation
+        formatted_deviation = format_distance(course_deviation)
         return {
             "avg_pace": convert_decimal_pace_to_pretty_format(self.runner.average_pace),
             "current_pace": convert_decimal_pace_to_pretty_format(self.runner.current_pace),
@@ -193,18 +171,14 @@ class Race:
             "start_time": self.start_time.strftime("%m-%d %H:%M"),
             "map_url": self.map_url,
             "aid_stations": self.course.aid_stations,
-            "course_deviation": format_distance(self.runner.course_deviation),
-            "deviation_background_color": "#90EE90"
-            if self.runner.course_deviation < 100
-            else "#FAFAD2"
-            if 100 <= self.runner.course_deviation <= 150
-            else "#FFD700"
-            if 151 <= self.runner.course_deviation <= 200
-            else "#FFC0CB",
+            "course_deviation": formatted_deviation,
+            "deviation_background_color": DEVIATION_COLORS[
+                bisect.bisect_left(DEVIATION_THRESHOLDS, course_deviation)
+            ],
             "debug_data": {
-                "course_deviation": format_distance(self.runner.course_deviation),
+                "course_deviation": formatted_deviation,
                 "last_ping": self.runner.last_ping.as_json,
-                "estimated_course_location": self.runner.estimate_marker.coordinates[::-1],
+                "estimated_course_location": self.runner.estimate_marker.latlon,
                 "pings": self.runner.pings,
                 "track_interval": self.runner.track_interval,
                 "low_battery": self.runner.low_battery,
@@ -223,8 +197,8 @@ class Race:
 
         :return None:
         """
-        with open(self.data_store, "w") as f:
-            f.write(json.dumps(self.stats))
+        with open(self.data_store, "wb") as f:
+            f.write(orjson.dumps(self.stats, option=orjson.OPT_SERIALIZE_NUMPY))
 
     def restore(self) -> None:
         """
@@ -233,8 +207,8 @@ class Race:
         :return None:
         """
         if os.path.exists(self.data_store):
-            with open(self.data_store, "r") as f:
-                data = json.load(f)
+            with open(self.data_store, "rb") as f:
+                data = orjson.loads(f.read())
                 self.runner.average_pace = data.get("average_pace", 10)
                 self.runner.pings = data.get("pings", 0)
                 self.runner.last_ping = Ping(data.get("last_ping", {}), self.course.timezone)
@@ -265,6 +239,7 @@ class Race:
             return
         self.runner.check_in(ping, self.start_time, self.course.route)
         self.course.update_aid_stations(self.runner)
+        self.version += 1
         self.save()
 
 
@@ -279,6 +254,7 @@ class Runner:
     def __init__(self, caltopo_map, marker_name: str):
         self.average_pace = 10
         self.current_pace = 10
+        self.elapsed_seconds = 0.0
         self.elapsed_time = datetime.timedelta(0)
         self.estimated_finish_date = datetime.datetime.fromtimestamp(0)
         self.estimated_finish_time = datetime.timedelta(0)
@@ -287,6 +263,7 @@ class Runner:
         self.low_battery = False
         self.marker, self.estimate_marker = self.extract_marker(marker_name, caltopo_map)
         self.mile_mark = 0
+        self.mile_mark_calculated = False
         self.pings = 0
         self.started = False
         self.track_interval = 300
@@ -318,9 +295,7 @@ class Runner:
         Calculates the average pace of the runner.
         :return float: The pace in minutes per mile.
         """
-        return (
-            (self.elapsed_time.total_seconds() / 60.0) / self.mile_mark if self.mile_mark else 10.0
-        )
+        return (self.elapsed_seconds / 60.0) / self.mile_mark if self.mile_mark else 10.0
 
     def check_if_started(self) -> None:
         """
@@ -331,6 +306,20 @@ class Runner:
         """
         self.started = self.mile_mark > 0.11
 
+    def has_moved(self, ping: Ping) -> bool:
+        """
+        Checks if the ping's location differs from the last ping's location. Anything within
+        roughly a meter of the last ping (e.g. a runner sitting at an aid station) is treated as
+        not having moved.
+
+        :param Ping ping: The runner's latest ping.
+        :return bool: True if the runner moved since the last ping and False otherwise.
+        """
+        return (
+            abs(ping.latitude - self.last_ping.latitude) >= 1e-5
+            or abs(ping.longitude - self.last_ping.longitude) >= 1e-5
+        )
+
     @property
     def course_deviation(self) -> float:
         """
@@ -338,11 +327,7 @@ class Runner:
 
         :return float: The uncertainty in the location calculation.
         """
-        return abs(
-            haversine_distance(
-                self.marker.coordinates[::-1], self.estimate_marker.coordinates[::-1]
-            )
-        )
+        return abs(haversine_distance(self.marker.latlon, self.estimate_marker.latlon))
 
     def check_if_finished(self, route) -> None:
         """
@@ -390,22 +375,23 @@ class Runner:
 
         :param Route route: The route of the course.
         :return tuple: The most probable mile mark and the coordinates of that mile mark on the
-        course.
+        course in (longitude, latitude) order.
         """
-        _, matched_indices = route.kdtree.query(self.last_ping.latlon, k=100)
-        mile_marks = [route.distances[i] for i in matched_indices]
-        expected_mile_mark = (self.elapsed_time.total_seconds() / 60) * (1 / self.average_pace)
-        for mm in mile_marks:
+        distances = route.distances
+        points = route.lonlat_points
+        average_pace = self.average_pace
+        matched_indices = route.nearest_indices(self.last_ping.latlon, 100)
+        mile_marks = distances[matched_indices]
+        elapsed_minutes = self.elapsed_seconds / 60.0
+        expected_mile_mark = elapsed_minutes * (1 / average_pace)
+        for index, mm in zip(matched_indices, mile_marks):
             if abs(mm - expected_mile_mark) < 0.5:
-                return mm, route.points[np.where(route.distances == mm)[0]].tolist()[0]
+                return mm, points[index].tolist()
         # If there was no mile mark found within a quarter mile of the anticipated mile mark, use
         # a different method for guessing the mile mark.
-        mile_mark = calculate_most_probable_mile_mark(
-            [route.distances[i] for i in matched_indices],
-            self.elapsed_time.total_seconds() / 60,
-            self.average_pace,
-        )
-        coords = route.points[np.where(route.distances == mile_mark)[0]].tolist()[0]
+        mile_mark = calculate_most_probable_mile_mark(mile_marks, elapsed_minutes, average_pace)
+        # The distances are sorted, so a binary search finds the first point at this mile mark.
+        coords = points[np.searchsorted(distances, mile_mark)].tolist()
         return mile_mark, coords
 
     def check_in(self, ping: Ping, start_time: datetime.datetime, route: Route) -> None:
@@ -418,6 +404,7 @@ class Runner:
         :param Route route: The route of the race.
         :return None:
         """
+        ping_timestamp = ping.timestamp
         last_timestamp = self.last_ping.timestamp
         self.pings += 1
         self.low_battery = ping.low_battery == 1
@@ -425,16 +412,27 @@ class Runner:
             self.track_interval = ping.interval_change
 
         # Don't update if latest point is older than current point
-        if last_timestamp > ping.timestamp:
+        if last_timestamp > ping_timestamp:
             logger.info(
-                f"incoming timestamp {ping.timestamp} older than last timestamp {last_timestamp}"
+                f"incoming timestamp {ping_timestamp} older than last timestamp {last_timestamp}"
             )
             return
         # At this point the race has started and this is a new ping.
+        moved = self.has_moved(ping)
         self.last_ping = ping
-        self.current_pace = kph_to_min_per_mi(self.last_ping.speed)
-        self.elapsed_time = ping.timestamp - start_time
-        self.mile_mark, coords = self.calculate_mile_mark(route)
+        self.current_pace = kph_to_min_per_mi(ping.speed)
+        self.elapsed_time = ping_timestamp - start_time
+        self.elapsed_seconds = self.elapsed_time.total_seconds()
+        marker = self.marker
+        estimate_marker = self.estimate_marker
+        if moved or not self.mile_mark_calculated:
+            self.mile_mark, coords = self.calculate_mile_mark(route)
+            self.mile_mark_calculated = True
+        else:
+            # The runner is stationary so the last estimate on the course still holds. This is only
+            # true once a mile mark has been calculated in this process; after a restore the last
+            # ping is known but the mile mark is not.
+            coords = estimate_marker.coordinates
         self.average_pace = self.calculate_pace()
         self.check_if_started()
         if not self.in_progress:
@@ -442,19 +440,20 @@ class Runner:
             return
         self.estimated_finish_time = datetime.timedelta(minutes=self.average_pace * route.length)
         self.estimated_finish_date = start_time + self.estimated_finish_time
+        heading = round(ping.heading)
         # Now update the marker attributes.
-        self.marker.description = self.marker_description
-        self.marker.coordinates = ping.lonlat
-        self.marker.rotation = round(ping.heading)
+        marker.description = self.marker_description
+        marker.coordinates = ping.lonlat
+        marker.rotation = heading
         # Update the estimate marker coordinates.
-        self.estimate_marker.coordinates = coords[::-1]
-        self.estimate_marker.rotation = round(ping.heading)
-        self.estimate_marker.description = ""
+        estimate_marker.coordinates = coords
+        estimate_marker.rotation = heading
+        estimate_marker.description = ""
         # Issue the POST to update the estimate marker.
-        CaltopoMarker.update(self.estimate_marker)
+        CaltopoMarker.update(estimate_marker)
         # Issue the POST to update the marker. This must be called this way to work with the uwsgi
         # thread decorator.
-        CaltopoMarker.update(self.marker)
+        CaltopoMarker.update(marker)
         self.check_if_finished(route)
         logger.info(self)
 
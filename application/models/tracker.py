@@ -3,6 +3,11 @@
 
 import datetime
 
+from .utils import FEET_PER_METER
+
+# Epoch timestamps above this can't be seconds (it's the year 5138), so they are milliseconds.
+MAX_EPOCH_SECONDS = 100_000_000_000
+
 
 def meters_to_feet(meters: float) -> float:
     """
@@ -11,7 +16,7 @@ def meters_to_feet(meters: float) -> float:
     :param float meters: A distance in meters.
     :return float: The distance in feet.
     """
-    return meters * 3.28084
+    return meters * FEET_PER_METER
 
 
 class Ping:
@@ -39,16 +44,18 @@ class Ping:
 
     def __init__(self, ping_data: dict, timezone):
         self._event = ping_data.get("Events", [{}])[0]
-        self.altitude = meters_to_feet(self._event.get("point", {}).get("altitude", 0.0))
-        self.gps_fix = self._event.get("point", {}).get("gpsFix", 0)
-        self.heading = self._event.get("point", {}).get("course", 0)
+        point = self._event.get("point") or {}
+        status = self._event.get("status") or {}
+        self.altitude = meters_to_feet(point.get("altitude", 0.0))
+        self.gps_fix = point.get("gpsFix", 0)
+        self.heading = point.get("course", 0)
         self.imei = self._event.get("imei")
-        self.latitude = self._event.get("point", {}).get("latitude", 0.0)
-        self.longitude = self._event.get("point", {}).get("longitude", 0.0)
+        self.latitude = point.get("latitude", 0.0)
+        self.longitude = point.get("longitude", 0.0)
         self.message_code = self._event.get("messageCode")
-        self.speed = self._event.get("point", {}).get("speed", 0.0)
-        self.low_battery = self._event.get("status", {}).get("lowBattery", 0)
-        self.interval_change = self._event.get("status", {}).get("intervalChange", 0)
+        self.speed = point.get("speed", 0.0)
+        self.low_battery = status.get("lowBattery", 0)
+        self.interval_change = status.get("intervalChange", 0)
         self.timestamp = self.extract_timestamp(timezone)
 
     @property
@@ -85,10 +92,11 @@ class Ping:
         :return datetime.datetime: A datetime object representing the timestamp.
         """
         ts = self._event.get("timeStamp", 0)
-        try:
-            return datetime.datetime.fromtimestamp(ts, timezone)
-        except ValueError:
-            return datetime.datetime.fromtimestamp(ts // 1000, timezone)
+        # The tracker sends milliseconds, so check for them up front rather than relying on
+        # fromtimestamp to raise for every ping.
+        if ts > MAX_EPOCH_SECONDS:
+            ts //= 1000
+        return datetime.datetime.fromtimestamp(ts, timezone)
 
     def __str__(self):
         return f"PING {self.timestamp} | {self.heading}° | {self.latlon}"
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+
+from math import asin, cos, radians, sin, sqrt
+
+import numpy as np
+
+FEET_PER_METER = 3.28084
+# The radius of the Earth in feet (6371 km).
+EARTH_RADIUS_FT = 6371000.0 * FEET_PER_METER
+# Folds the factor of 2 from the Haversine formula into the radius.
+EARTH_DIAMETER_FT = 2 * EARTH_RADIUS_FT
+# The WGS84 ellipsoid's semi-major axis (in feet) and first eccentricity squared.
+WGS84_A_FT = 6378137.0 * FEET_PER_METER
+WGS84_E2 = 6.69437999014e-3
+
+
+def haversine_distance(coord1: list, coord2: list) -> float:
+    """
+    Calculate the Haversine distance between two points specified by their latitude and longitude coordinates.
+
+    :param list coord1: Latitude and longitude coordinates of the first point in the format
+    [latitude, longitude].
+    :param list coord2: Latitude and longitude coordinates of the second point in the format
+    [latitude, longitude].
+    :return float: The distance between the two points in feet.
+    """
+    # This intentionally uses the `math` functions rather than NumPy; NumPy's ufuncs are much
+    # slower on single Python floats.
+    # Convert latitudes and the longitude difference from degrees to radians
+    lat1 = radians(coord1[0])
+    lat2 = radians(coord2[0])
+    dlat = lat2 - lat1
+    dlon = radians(coord2[1] - coord1[1])
+    # Haversine formula
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    # Clamp to guard against floating point drift above 1 for nearly antipodal points.
+    return EARTH_DIAMETER_FT * asin(sqrt(min(a, 1.0)))
+
+
+def equirectangular_distance(coord1: list, coord2: list) -> float:
+    """
+    Calculate the approximate distance between two nearby points using an equirectangular
+    projection. This is much cheaper than the Haversine formula and, for points less than a
+    kilometer apart, is within about 0.5% of it.
+
+    :param list coord1: Latitude and longitude coordinates of the first point in the format
+    [latitude, longitude].
+    :param list coord2: Latitude and longitude coordinates of the second point in the format
+    [latitude, longitude].
+    :return float: The approximate distance between the two points in feet.
+    """
+    cos_lat = cos(radians((coord1[0] + coord2[0]) / 2))
+    dlat = radians(coord2[0] - coord1[0])
+    dlon = radians(coord2[1] - coord1[1]) * cos_lat
+    return EARTH_RADIUS_FT * sqrt(dlat * dlat + dlon * dlon)
+
+
+def geodesic_segment_distances(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Calculate the lengths of the segments between consecutive points of a path on the WGS84
+    ellipsoid. Each segment is measured with the ellipsoid's meridional and prime vertical radii of
+    curvature at its mid-latitude, which agrees with a full geodesic calculation to well under a
+    millimeter for the short (sub-kilometer) segments of an interpolated route.
+
+    :param numpy.ndarray lat: The latitudes of the points in radians.
+    :param numpy.ndarray lon: The longitudes of the points in radians.
+    :return numpy.ndarray: An array one shorter than the input of the segment lengths in feet.
+    """
+    mid_lat = (lat[:-1] + lat[1:]) / 2
+    dlat = np.diff(lat)
+    # Wrap the longitude differences so segments crossing the antimeridian stay short.
+    dlon = (np.diff(lon) + np.pi) % (2 * np.pi) - np.pi
+    w = np.sqrt(1 - WGS84_E2 * np.sin(mid_lat) ** 2)
+    # Radii of curvature along the meridian and along the parallel.
+    meridional_radius = WGS84_A_FT * (1 - WGS84_E2) / w**3
+    prime_vertical_radius = WGS84_A_FT / w
+    return np.hypot(meridional_radius * dlat, prime_vertical_radius * np.cos(mid_lat) * dlon)
@@ -1,18 +1,84 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
 import datetime
-import json
+import decimal
+import hashlib
+import hmac
 import logging
+import os
 import sys
 
+import orjson
 import yaml
-from flask import Flask, render_template, request
+from flask import Flask, make_response, render_template, request
+from flask.json.provider import JSONProvider
 from models.caltopo import CaltopoMap
 from models.course import Course
 from models.race import Race, Runner
+from werkzeug.http import http_date
+
+try:
+    # Prefer the libyaml-backed loader when PyYAML was built with it.
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+def _default(obj):
+    """
+    Serializes the types that orjson doesn't handle natively the same way as Flask's default JSON
+    provider.
+
+    :param obj: The object to serialize.
+    :return str: The serialized object.
+    """
+    if isinstance(obj, datetime.date):
+        return http_date(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    A Flask JSON provider that uses orjson for (de)serialization. This is used by the `tojson`
+    template filter as well as any JSON responses.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        """
+        Serializes an object to a JSON string.
+
+        :param obj: The object to serialize.
+        :return str: The JSON string.
+        """
+        # Datetimes are passed to `_default` so they keep Flask's HTTP date format.
+        option = (
+            orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get("sort_keys"):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        """
+        Deserializes a JSON string or bytes to a Python object.
+
+        :param s: The JSON string or bytes.
+        :return: The deserialized object.
+        """
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+logger = logging.getLogger(__name__)
 
 
 def setup_logging():
@@ -59,7 +125,7 @@ def get_config_data(file_path: str) -> dict:
     """
     try:
         with open(file_path, "r") as file:
-            yaml_content = yaml.safe_load(file)
+            yaml_content = yaml.load(file, Loader=SafeLoader)
         return yaml_content
     except FileNotFoundError:
         logger.info(f"Error: File '{file_path}' not found.")
@@ -72,11 +138,25 @@ def get_config_data(file_path: str) -> dict:
 @app.route("/", methods=["GET"])
 def get_race_stats():
     """
-    Renders the webpage for the race statistics and monitoring.
+    Renders the webpage for the race statistics and monitoring. The rendered page is cached until
+    the race state changes and is served with an ETag so browsers can revalidate.
 
     :return tuple: The rendered HTML page.
     """
-    return render_template("race_stats.html", **race.html_stats)
+    race = app.config["UT_RACE"]
+    version = race.version
+    cached = app.config["UT_STATS_PAGE_CACHE"]
+    if cached is None or cached[0] != version:
+        html = render_template("race_stats.html", **race.html_stats)
+        cached = (version, html, hashlib.sha1(html.encode()).hexdigest())
+        app.config["UT_STATS_PAGE_CACHE"] = cached
+    _, html, etag = cached
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(html)
+    response.set_etag(etag)
+    return response
 
 
 @app.route("/", methods=["POST"])
@@ -86,49 +166,70 @@ def post_data():
 
     :return tuple: The HTTP response.
     """
-    if request.headers.get("x-outbound-auth-token") != app.config["UT_GARMIN_API_TOKEN"]:
+    supplied_token = request.headers.get("x-outbound-auth-token", "").encode()
+    if not hmac.compare_digest(supplied_token, app.config["UT_GARMIN_API_TOKEN"]):
         return "Invalid or missing auth token", 401
     content_length = request.headers.get("Content-Length", 0)
     if not content_length:
         return "Content-Length header is missing or zero", 411
-    payload = request.get_data(as_text=True)
-    with open("./.post_log.txt", "a") as file:
-        file.write(f"{payload}\n")
-    app.config["UT_RACE"].ingest_ping(json.loads(payload))
+    payload = request.get_data(cache=False)
+    os.write(app.config["UT_POST_LOG_FD"], payload + b"\n")
+    app.config["UT_RACE"].ingest_ping(orjson.loads(payload))
     return "OK", 200
 
 
-# Read in the config file.
-args = parse_args()
-# TODO: Need to validate values and keys.
-config_data = get_config_data(args.config)
-setup_logging()
-logger = logging.getLogger(__name__)
-# Create the objects to manage the race.
-caltopo_map = CaltopoMap(config_data["caltopo_map_id"], config_data["caltopo_session_id"])
-logger.info("created map object...")
-course = Course(caltopo_map, config_data["aid_stations"], config_data["route_name"])
-logger.info("created course object...")
-runner = Runner(caltopo_map, config_data["tracker_marker_name"])
-logger.info("created runner object...")
-race = Race(
-    config_data["race_name"],
-    caltopo_map,
-    course.timezone.localize(
-        datetime.datetime.strptime(config_data["start_time"], "%Y-%m-%dT%H:%M:%S")
-    ),
-    ".data_store.json",
-    course,
-    runner,
-)
-logger.info("created race object...")
-app.config["UT_GARMIN_API_TOKEN"] = config_data["garmin_api_token"]
-app.config["UT_RACE"] = race
-logger.info("performing authentication test...")
-if not caltopo_map.test_authentication():
-    exit(1)
-logger.info("authentication test passed...")
+def create_app(config_path: str) -> Flask:
+    """
+    Reads the race config, builds the map, course, runner, and race objects, and attaches them to
+    the module's application. Nothing is built at import time so that importing this module is
+    cheap. Calling this again rebuilds the race on the same application.
+
+    :param str config_path: The path to the race config file.
+    :return Flask: The configured application.
+    """
+    # TODO: Need to validate values and keys.
+    config_data = get_config_data(config_path)
+    # Only add the stdout handler once if the app is created more than once.
+    if not logging.root.handlers:
+        setup_logging()
+    # Create the objects to manage the race.
+    caltopo_map = CaltopoMap(config_data["caltopo_map_id"], config_data["caltopo_session_id"])
+    logger.info("created map object...")
+    course = Course(caltopo_map, config_data["aid_stations"], config_data["route_name"])
+    logger.info("created course object...")
+    runner = Runner(caltopo_map, config_data["tracker_marker_name"])
+    logger.info("created runner object...")
+    race = Race(
+        config_data["race_name"],
+        caltopo_map,
+        course.timezone.localize(
+            datetime.datetime.strptime(config_data["start_time"], "%Y-%m-%dT%H:%M:%S")
+        ),
+        ".data_store.json",
+        course,
+        runner,
+    )
+    logger.info("created race object...")
+    # Stored as bytes so the token does not need to be encoded for each comparison.
+    app.config["UT_GARMIN_API_TOKEN"] = config_data["garmin_api_token"].encode()
+    app.config["UT_RACE"] = race
+    # The rendered stats page as (race version, html, etag); cleared whenever the race is rebuilt.
+    app.config["UT_STATS_PAGE_CACHE"] = None
+    # Keep the post log open for the life of the process rather than opening it for every ping.
+    # Each payload is appended with a single write on an O_APPEND descriptor, so concurrent
+    # requests do not interleave and no lock is needed. Only open it once if the app is created
+    # more than once.
+    if "UT_POST_LOG_FD" not in app.config:
+        app.config["UT_POST_LOG_FD"] = os.open(
+            "./.post_log.txt", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        atexit.register(os.close, app.config["UT_POST_LOG_FD"])
+    logger.info("performing authentication test...")
+    if not caltopo_map.test_authentication():
+        exit(1)
+    logger.info("authentication test passed...")
+    return app
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    create_app(parse_args().config).run(host="0.0.0.0", port=8080)
@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+
+from server import create_app, parse_args
+
+# The WSGI entry point used by uWSGI. The config path is passed in via `--pyargv`.
+app = create_app(parse_args().config)